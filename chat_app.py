@@ -7,14 +7,25 @@ Run with:
 
 from __future__ import annotations as _annotations
 
-import json
+import asyncio
+import gzip
+import hashlib
 import logging
+import os
+import re
+import stat
+import time
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterable, AsyncIterator
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Annotated, Literal
 
+import aiofiles
 import fastapi
-from fastapi.responses import FileResponse, Response, StreamingResponse
+import orjson
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from typing_extensions import TypedDict
 
@@ -31,8 +42,17 @@ from openai.types.responses import WebSearchToolParam
 
 from pydantic_ai.models.openai import OpenAIResponsesModel, OpenAIResponsesModelSettings
 
+try:
+    from fastapi.sse import EventSourceResponse
+except ImportError:  # FastAPI < 0.135, fall back to newline delimited JSON
+    EventSourceResponse = None
+
 THIS_DIR = Path(__file__).parent
 
+# Filenames containing a path separator or ".." could escape THIS_DIR, and a NUL
+# byte makes the OS calls raise, so reject them all in one precompiled search
+_BAD_FILENAME = re.compile(r"[\\/\x00]|\.\.")
+
 
 # Configure logging
 logging.basicConfig(
@@ -62,88 +82,175 @@ model = OpenAIResponsesModel("gpt-4o-mini")
 agent = Agent(model=model, model_settings=model_settings)
 
 
-# In-memory storage for chat messages
-messages_store: list[ModelMessage] = []
+# In-memory storage for chat messages, only the most recent messages are kept so
+# memory and the history sent to the model stay bounded. Each chat turn adds a
+# request/response pair, so keep this even to never start history on a response.
+MAX_HISTORY_MESSAGES = 200
+messages_store: deque[ModelMessage] = deque(maxlen=MAX_HISTORY_MESSAGES)
+# Pre-serialized `ChatMessage` JSON for each entry in `messages_store`, or `None` if
+# it can't be shown in the chat, so `get_chat` doesn't re-encode the history on
+# every request. Kept one for one with `messages_store` so both evict together.
+messages_bytes: deque[bytes | None] = deque(maxlen=MAX_HISTORY_MESSAGES)
+# Guards mutation of `messages_store` and `messages_bytes` so they change together
+_store_lock = asyncio.Lock()
 
 app = fastapi.FastAPI()
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Only static files are gzipped, compressing the chat streams would buffer them
+app.mount(
+    "/static",
+    GZipMiddleware(StaticFiles(directory="static"), minimum_size=500),
+    name="static",
+)
+
+
+# Files served by `index` and `main_ts`, keyed by name, with the mtime they were
+# read at, so edits show up on refresh without a server reload
+_static_cache: dict[str, tuple[int, bytes, bytes, str]] = {}
+
+
+def _load_static(name: str) -> tuple[bytes, bytes, str]:
+    """Return a file from static/, gzipped and its ETag, re-reading it if changed."""
+    path = THIS_DIR / "static" / name
+    mtime_ns = path.stat().st_mtime_ns
+    cached = _static_cache.get(name)
+    if cached is None or cached[0] != mtime_ns:
+        body = path.read_bytes()
+        etag = f'"{hashlib.md5(body, usedforsecurity=False).hexdigest()}"'
+        cached = (mtime_ns, body, gzip.compress(body, 9), etag)
+        _static_cache[name] = cached
+    return cached[1:]
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip, honouring q-values."""
+    qualities: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[coding.strip().lower()] = q
+    # an explicit gzip entry takes precedence over the "*" wildcard
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
+def _static_response(request: fastapi.Request, name: str, media_type: str) -> Response:
+    """Respond with a cached static file, or a 304 if the client's copy is current."""
+    body, body_gz, etag = _load_static(name)
+    # each content-coding needs its own strong validator
+    etag_gz = etag[:-1] + '-gzip"'
+    use_gzip = _accepts_gzip(request.headers.get("accept-encoding", ""))
+    headers = {
+        "ETag": etag_gz if use_gzip else etag,
+        "Cache-Control": "public, max-age=60",
+        "Vary": "Accept-Encoding",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if any(tag.strip() in (etag, etag_gz) for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        body = body_gz
+    return Response(body, media_type=media_type, headers=headers)
 
 
 @app.get("/")
-async def index() -> FileResponse:
-    return FileResponse((THIS_DIR / "chat_app.html"), media_type="text/html")
+async def index(request: fastapi.Request) -> Response:
+    return _static_response(request, "index.html", "text/html")
 
 
 @app.get("/chat_app.ts")
-async def main_ts() -> FileResponse:
+async def main_ts(request: fastapi.Request) -> Response:
     """Get the raw typescript code, it's compiled in the browser, forgive me."""
-    return FileResponse((THIS_DIR / "chat_app.ts"), media_type="text/plain")
+    return _static_response(request, "chat_app.ts", "application/typescript")
 
 
 @app.get("/chat/")
-async def get_chat() -> Response:
-    msgs = messages_store
-    return Response(
-        b"\n".join(json.dumps(to_chat_message(m)).encode("utf-8") for m in msgs),
-        media_type="text/plain",
-    )
+async def get_chat() -> StreamingResponse:
+    """Streams the stored chat history as new line delimited JSON `ChatMessage`s."""
+    async with _store_lock:
+        lines = [line for line in messages_bytes if line is not None]
+
+    # async so Starlette doesn't iterate it in a threadpool
+    async def stream_history() -> AsyncIterator[bytes]:
+        for line in lines:
+            yield line + b"\n"
+
+    return StreamingResponse(stream_history(), media_type="text/plain")
+
+
+# Cached `/files/` response body and the `time.monotonic()` it was built at
+_files_cache: tuple[float, bytes] | None = None
+_FILES_TTL = 5.0
 
 
 @app.get("/files/")
 async def get_files() -> Response:
     """Get list of files in the current directory."""
-    try:
-        # Get all files in the current directory
-        files = []
-        for file_path in THIS_DIR.iterdir():
-            if file_path.is_file() and not file_path.name.startswith("."):
-                files.append(file_path.name)
+    global _files_cache
+    if _files_cache is not None:
+        cached_at, body = _files_cache
+        if time.monotonic() - cached_at < _FILES_TTL:
+            return Response(body, media_type="application/json")
 
-        # Sort files alphabetically
-        files.sort()
+    try:
+        # Get all files in the current directory, sorted alphabetically. scandir
+        # gets the file type from the directory listing itself so, unlike
+        # `Path.is_file()`, only symlinks need an extra stat
+        with os.scandir(THIS_DIR) as entries:
+            files = sorted(
+                entry.name
+                for entry in entries
+                if not entry.name.startswith(".") and entry.is_file()
+            )
 
-        return Response(
-            json.dumps({"files": files}).encode("utf-8"),
-            media_type="application/json",
-        )
+        body = orjson.dumps({"files": files})
+        _files_cache = (time.monotonic(), body)
+        return Response(body, media_type="application/json")
     except Exception as e:
         return Response(
-            json.dumps({"files": [], "error": str(e)}).encode("utf-8"),
+            orjson.dumps({"files": [], "error": str(e)}),
             media_type="application/json",
         )
 
 
+# Error bodies for `get_file_content`, encoded once rather than on every miss
+_INVALID_FILENAME_BODY = orjson.dumps({"error": "Invalid filename"})
+_FILE_NOT_FOUND_BODY = orjson.dumps({"error": "File not found"})
+
+
 @app.get("/files/{filename}")
 async def get_file_content(filename: str) -> Response:
     """Get the content of a specific file."""
     try:
         # Security check: prevent directory traversal
-        if ".." in filename or "/" in filename or "\\" in filename:
+        if not filename or _BAD_FILENAME.search(filename):
             return Response(
-                json.dumps({"error": "Invalid filename"}).encode("utf-8"),
-                media_type="application/json",
-                status_code=400,
+                _INVALID_FILENAME_BODY, media_type="application/json", status_code=400
             )
 
         file_path = THIS_DIR / filename
 
         if not file_path.exists() or not file_path.is_file():
             return Response(
-                json.dumps({"error": "File not found"}).encode("utf-8"),
-                media_type="application/json",
-                status_code=404,
+                _FILE_NOT_FOUND_BODY, media_type="application/json", status_code=404
             )
 
         # Read file content
         content = file_path.read_text(encoding="utf-8")
 
         return Response(
-            json.dumps({"content": content}).encode("utf-8"),
+            orjson.dumps({"content": content}),
             media_type="application/json",
         )
     except Exception as e:
         return Response(
-            json.dumps({"error": str(e)}).encode("utf-8"),
+            orjson.dumps({"error": str(e)}),
             media_type="application/json",
             status_code=500,
         )
@@ -153,129 +260,201 @@ class ChatMessage(TypedDict):
     """Format of messages sent to the browser."""
 
     role: Literal["user", "model"]
-    timestamp: str
+    timestamp: datetime
     content: str
 
 
+# The browser uses `timestamp` to identify messages, so orjson must write UTC as
+# "...Z" like pydantic does for the server-sent events
+_CHAT_JSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+
 def to_chat_message(m: ModelMessage) -> ChatMessage:
-    first_part = m.parts[0]
+    # responses that used a built-in tool (code execution, web search) start with
+    # the tool call parts, so find the first part that can be shown
     if isinstance(m, ModelRequest):
-        if isinstance(first_part, UserPromptPart):
-            assert isinstance(first_part.content, str)
-            return {
-                "role": "user",
-                "timestamp": first_part.timestamp.isoformat(),
-                "content": first_part.content,
-            }
+        for part in m.parts:
+            if isinstance(part, UserPromptPart) and isinstance(part.content, str):
+                return {
+                    "role": "user",
+                    "timestamp": part.timestamp,
+                    "content": part.content,
+                }
     elif isinstance(m, ModelResponse):
-        if isinstance(first_part, TextPart):
-            return {
-                "role": "model",
-                "timestamp": m.timestamp.isoformat(),
-                "content": first_part.content,
-            }
+        for part in m.parts:
+            if isinstance(part, TextPart):
+                return {
+                    "role": "model",
+                    "timestamp": m.timestamp,
+                    "content": part.content,
+                }
     raise UnexpectedModelBehavior(f"Unexpected message type for chat app: {m}")
 
 
-async def handle_image(filename: str) -> str:
+def handle_image(filename: str) -> str:
     """Placeholder for image handling."""
     print(f"Handling image: {filename}")
     return f"[Image: {filename}]"
 
 
-async def handle_pdf(filename: str) -> str:
+def handle_pdf(filename: str) -> str:
     """Placeholder for PDF handling."""
     print(f"Handling PDF: {filename}")
     return f"[PDF: {filename}]"
 
 
+# Wrapped text file contexts keyed by (path, st_mtime_ns, st_size), so an edited
+# file misses the cache and stale entries simply age out
+_file_context_cache: OrderedDict[tuple[str, int, int], str] = OrderedDict()
+_FILE_CONTEXT_CACHE_SIZE = 256
+
+
+async def _read_file_context(file_path: Path, st: os.stat_result) -> str:
+    """Read a text file and wrap it for the prompt, caching the result."""
+    key = (str(file_path), st.st_mtime_ns, st.st_size)
+    context = _file_context_cache.get(key)
+    if context is not None:
+        _file_context_cache.move_to_end(key)
+        return context
+
+    # the raw content is only referenced by the list, so it can be freed as soon
+    # as the joined context (a single allocation) is built
+    async with aiofiles.open(file_path, "r", encoding="utf-8") as f:
+        context = "".join(
+            ["File: ", file_path.name, "\n```\n", await f.read(), "\n```"]
+        )
+
+    _file_context_cache[key] = context
+    if len(_file_context_cache) > _FILE_CONTEXT_CACHE_SIZE:
+        _file_context_cache.popitem(last=False)
+    return context
+
+
 async def process_file(filename: str) -> str:
     """Process a file and return its content or a description."""
     try:
         # Security check
-        if ".." in filename or "/" in filename or "\\" in filename:
+        if not filename or _BAD_FILENAME.search(filename):
             return f"Error: Invalid filename {filename}"
 
         file_path = THIS_DIR / filename
-        if not file_path.exists() or not file_path.is_file():
+        try:
+            st = file_path.stat()
+        except FileNotFoundError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
             return f"Error: File not found {filename}"
 
         ext = file_path.suffix.lower()
         if ext in [".jpg", ".jpeg", ".png", ".gif", ".webp"]:
-            return await handle_image(filename)
+            return handle_image(filename)
         elif ext == ".pdf":
-            return await handle_pdf(filename)
+            return handle_pdf(filename)
         else:
-            content = file_path.read_text(encoding="utf-8")
-            return f"File: {filename}\n```\n{content}\n```"
+            return await _read_file_context(file_path, st)
     except Exception as e:
         return f"Error reading file {filename}: {e}"
 
 
-@app.post("/chat/")
-async def post_chat(
-    prompt: Annotated[str, fastapi.Form()],
-    selected_files: Annotated[list[str], fastapi.Form()] = [],
-) -> StreamingResponse:
-    async def stream_messages():
-        """Streams new line delimited JSON `Message`s to the client."""
-
-        # Process selected files
-        file_contexts = []
-        for filename in selected_files:
-            file_contexts.append(await process_file(filename))
-
-        full_prompt = prompt
-        if file_contexts:
-            full_prompt += "\n\nContext:\n" + "\n\n".join(file_contexts)
+async def stream_messages(
+    prompt: str, selected_files: list[str]
+) -> AsyncIterator[ChatMessage]:
+    """Runs the agent on `prompt`, yielding the user prompt then each response chunk."""
+
+    # Process selected files concurrently
+    file_contexts = await asyncio.gather(*map(process_file, selected_files))
+
+    full_prompt = prompt
+    if file_contexts:
+        full_prompt += "\n\nContext:\n" + "\n\n".join(file_contexts)
+
+    # stream the user prompt so that can be displayed straight away
+    yield {
+        "role": "user",
+        "timestamp": datetime.now(tz=timezone.utc),
+        "content": prompt,
+    }
+
+    # get the chat history so far to pass as context to the agent
+    async with _store_lock:
+        messages = list(messages_store)
+    # run the agent with the user prompt and the chat history
+    async with agent.run_stream(full_prompt, message_history=messages) as result:
+        async for text in result.stream_output(debounce_by=0.01):
+            # text here is a `str` and the frontend wants
+            # JSON encoded ModelResponse, so we create one
+            m = ModelResponse(parts=[TextPart(text)], timestamp=result.timestamp())
+            yield to_chat_message(m)
+
+        # After streaming is complete, log all tool calls that occurred
+        for msg in result.all_messages():
+            if isinstance(msg, ModelResponse):
+                for part in msg.parts:
+                    if hasattr(part, "tool_name"):
+                        logger.info(f"🔧 Tool called: {part.tool_name}")
+                        if hasattr(part, "args"):
+                            logger.info(f"   Args: {part.args}")
+                    elif part.__class__.__name__ == "ToolCallPart":
+                        logger.info(f"🔧 Tool called: {part.tool_name}")
+                        logger.info(f"   Args: {part.args}")
+
+    # add new messages (e.g. the user prompt and the agent response in this case) to memory
+    # We store the full prompt with context so the agent remembers it in history
+    # Or should we store just the user prompt? PydanticAI handles history.
+    # If we pass full_prompt to run_stream, it's treated as the new user message.
+    new_messages = result.new_messages()
+    new_bytes: list[bytes | None] = []
+    for m in new_messages:
+        # every message goes into the agent's history, even if it can't be shown
+        try:
+            chat_message = to_chat_message(m)
+        except UnexpectedModelBehavior:
+            logger.info(f"{type(m).__name__} has no part to show in the chat")
+            new_bytes.append(None)
+            continue
+        new_bytes.append(orjson.dumps(chat_message, option=_CHAT_JSON_OPTIONS))
+    async with _store_lock:
+        messages_store.extend(new_messages)
+        messages_bytes.extend(new_bytes)
+
+
+if EventSourceResponse is not None:
+
+    @app.post("/chat/", response_class=EventSourceResponse)
+    async def post_chat(
+        prompt: Annotated[str, fastapi.Form()],
+        selected_files: Annotated[list[str], fastapi.Form()] = [],
+    ) -> AsyncIterable[ChatMessage]:
+        """Streams `ChatMessage`s to the client as server-sent events.
+
+        FastAPI validates and encodes each yielded message with pydantic-core and
+        sends keep-alive pings during long generations.
+        """
+        async for message in stream_messages(prompt, selected_files):
+            yield message
 
-        # stream the user prompt so that can be displayed straight away
-        yield (
-            json.dumps(
-                {
-                    "role": "user",
-                    "timestamp": datetime.now(tz=timezone.utc).isoformat(),
-                    "content": prompt,
-                }
-            ).encode("utf-8")
-            + b"\n"
-        )
+else:
 
-        # get the chat history so far to pass as context to the agent
-        messages = messages_store
-        # run the agent with the user prompt and the chat history
-        async with agent.run_stream(full_prompt, message_history=messages) as result:
-            async for text in result.stream_output(debounce_by=0.01):
-                # text here is a `str` and the frontend wants
-                # JSON encoded ModelResponse, so we create one
-                m = ModelResponse(parts=[TextPart(text)], timestamp=result.timestamp())
-                yield json.dumps(to_chat_message(m)).encode("utf-8") + b"\n"
-
-            # After streaming is complete, log all tool calls that occurred
-            for msg in result.all_messages():
-                if isinstance(msg, ModelResponse):
-                    for part in msg.parts:
-                        if hasattr(part, "tool_name"):
-                            logger.info(f"🔧 Tool called: {part.tool_name}")
-                            if hasattr(part, "args"):
-                                logger.info(f"   Args: {part.args}")
-                        elif part.__class__.__name__ == "ToolCallPart":
-                            logger.info(f"🔧 Tool called: {part.tool_name}")
-                            logger.info(f"   Args: {part.args}")
+    @app.post("/chat/")
+    async def post_chat(
+        prompt: Annotated[str, fastapi.Form()],
+        selected_files: Annotated[list[str], fastapi.Form()] = [],
+    ) -> StreamingResponse:
+        """Streams new line delimited JSON `ChatMessage`s to the client."""
 
-        # add new messages (e.g. the user prompt and the agent response in this case) to memory
-        # We store the full prompt with context so the agent remembers it in history
-        # Or should we store just the user prompt? PydanticAI handles history.
-        # If we pass full_prompt to run_stream, it's treated as the new user message.
-        messages_store.extend(result.new_messages())
+        async def stream_ndjson() -> AsyncIterator[bytes]:
+            async for message in stream_messages(prompt, selected_files):
+                yield orjson.dumps(message, option=_CHAT_JSON_OPTIONS) + b"\n"
 
-    return StreamingResponse(stream_messages(), media_type="text/plain")
+        return StreamingResponse(stream_ndjson(), media_type="text/plain")
 
 
 @app.post("/chat/clear")
 async def clear_chat() -> Response:
     """Clear stored chat messages."""
-    messages_store.clear()
+    async with _store_lock:
+        messages_store.clear()
+        messages_bytes.clear()
     return Response(status_code=204)
 
 
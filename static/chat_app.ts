@@ -55,22 +55,26 @@ function processMermaid(content: string): string {
 
 
 // stream the response and render messages as each chunk is received
-// data is sent as newline-delimited JSON
+// `POST /chat/` sends server-sent events (a `fetch` body is used rather than `EventSource`
+// since the latter can only issue GET requests), `GET /chat/` and older servers send
+// newline-delimited JSON
 async function onFetchResponse(response: Response): Promise<void> {
   let text = ''
   let decoder = new TextDecoder()
   if (response.ok) {
+    const contentType = response.headers.get('content-type') || ''
+    const parse = contentType.startsWith('text/event-stream') ? parseEventStream : parseNdjson
     const reader = response.body.getReader()
     while (true) {
       const { done, value } = await reader.read()
       if (done) {
         break
       }
-      text += decoder.decode(value)
-      addMessages(text)
+      text += decoder.decode(value, { stream: true })
+      addMessages(parse(text))
       spinner.classList.remove('active')
     }
-    addMessages(text)
+    addMessages(parse(text))
     promptInput.disabled = false
     promptInput.focus()
   } else {
@@ -80,6 +84,29 @@ async function onFetchResponse(response: Response): Promise<void> {
   }
 }
 
+// only complete lines (terminated by a newline) are parsed
+function parseNdjson(responseText: string): Message[] {
+  const lines = responseText.split('\n').slice(0, -1)
+  return lines.filter(line => line.length > 1).map(j => JSON.parse(j))
+}
+
+// only complete events (terminated by a blank line) are parsed, keep-alive comments are skipped
+function parseEventStream(responseText: string): Message[] {
+  const events = responseText.replace(/\r\n?/g, '\n').split('\n\n').slice(0, -1)
+  const messages: Message[] = []
+  for (const event of events) {
+    const data = event
+      .split('\n')
+      .filter(line => line.startsWith('data:'))
+      .map(line => line.slice(5).replace(/^ /, ''))
+      .join('\n')
+    if (data) {
+      messages.push(JSON.parse(data))
+    }
+  }
+  return messages
+}
+
 // The format of messages, this matches pydantic-ai both for brevity and understanding
 // in production, you might not want to keep this format all the way to the frontend
 interface Message {
@@ -88,13 +115,11 @@ interface Message {
   timestamp: string
 }
 
-// take raw response text and render messages into the `#conversation` element
+// render messages into the `#conversation` element
 // Message timestamp is assumed to be a unique identifier of a message, and is used to deduplicate
 // hence you can send data about the same message multiple times, and it will be updated
 // instead of creating a new message elements
-function addMessages(responseText: string) {
-  const lines = responseText.split('\n')
-  const messages: Message[] = lines.filter(line => line.length > 1).map(j => JSON.parse(j))
+function addMessages(messages: Message[]) {
   for (const message of messages) {
     // we use the timestamp as a crude element id
     const { timestamp, role, content } = message
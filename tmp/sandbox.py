@@ -1,3 +1,6 @@
+import asyncio
+from contextlib import AsyncExitStack
+
 from mcp_run_python import code_sandbox
 
 code = """
@@ -6,14 +9,45 @@ numpy.array([1, 2, 3])
 
 """
 
+# Starting the sandbox (resolving and installing dependencies) is far more
+# expensive than running code in it, so one sandbox is shared by every eval
+_sandbox = None
+_sandbox_stack: AsyncExitStack | None = None
+_sandbox_lock = asyncio.Lock()
+
+
+async def get_sandbox():
+    """Return the shared sandbox, starting it on first use."""
+    global _sandbox, _sandbox_stack
+    if _sandbox is not None:
+        return _sandbox
+    async with _sandbox_lock:
+        if _sandbox is None:
+            stack = AsyncExitStack()
+            _sandbox = await stack.enter_async_context(
+                code_sandbox(dependencies=["numpy"])
+            )
+            _sandbox_stack = stack
+    return _sandbox
+
+
+async def close_sandbox():
+    """Shut down the shared sandbox, if it was started."""
+    global _sandbox, _sandbox_stack
+    async with _sandbox_lock:
+        if _sandbox_stack is not None:
+            await _sandbox_stack.aclose()
+        _sandbox = _sandbox_stack = None
+
 
 async def main():
-    async with code_sandbox(dependencies=["numpy"]) as sandbox:
+    try:
+        sandbox = await get_sandbox()
         result = await sandbox.eval(code)
         print(result)
+    finally:
+        await close_sandbox()
 
 
 if __name__ == "__main__":
-    import asyncio
-
     asyncio.run(main())